@@ -0,0 +1,92 @@
+"""Convert string UUID ids to BSON Binary subtype 4.
+
+Run once before deploying the binary-UUID server:
+
+    python migrate_uuids.py
+
+Only documents that still hold string ids are touched, so re-running is safe.
+"""
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from bson.binary import Binary, UuidRepresentation
+from pathlib import Path
+import os
+import logging
+import uuid
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# collection -> (top-level id fields, array-of-id fields, array-of-item fields holding product_id)
+MIGRATIONS = {
+    'users': (['id'], ['wishlist'], []),
+    'products': (['id'], [], []),
+    'reviews': (['id', 'product_id', 'user_id'], [], []),
+    'carts': (['user_id'], [], ['items']),
+    'orders': (['id', 'user_id'], [], ['items']),
+}
+
+def _to_uuid(value):
+    if isinstance(value, str):
+        try:
+            return Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+        except ValueError:
+            logger.warning(f"Leaving non-UUID id {value!r} unchanged")
+    return value
+
+def _convert(doc: dict, fields: list, id_arrays: list, item_arrays: list) -> dict:
+    changes = {}
+    for field in fields:
+        if field in doc:
+            value = _to_uuid(doc[field])
+            if value != doc[field]:
+                changes[field] = value
+    for field in id_arrays:
+        values = doc.get(field) or []
+        converted = [_to_uuid(v) for v in values]
+        if converted != values:
+            changes[field] = converted
+    for field in item_arrays:
+        items = doc.get(field) or []
+        converted = [{**item, 'product_id': _to_uuid(item['product_id'])} if 'product_id' in item else item
+                     for item in items]
+        if converted != items:
+            changes[field] = converted
+    return changes
+
+def migrate_collection(collection, fields: list, id_arrays: list, item_arrays: list, batch_size: int = 500) -> int:
+    string_type = {'$type': 'string'}
+    query = {'$or': [{f: string_type} for f in fields] +
+                    [{f: string_type} for f in id_arrays] +
+                    [{f'{f}.product_id': string_type} for f in item_arrays]}
+
+    updated = 0
+    ops = []
+    for doc in collection.find(query):
+        changes = _convert(doc, fields, id_arrays, item_arrays)
+        if changes:
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': changes}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+def migrate(db) -> None:
+    for name, (fields, id_arrays, item_arrays) in MIGRATIONS.items():
+        updated = migrate_collection(db[name], fields, id_arrays, item_arrays)
+        logger.info(f"{name}: converted {updated} documents")
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    client = MongoClient(os.environ['MONGO_URL'])
+    try:
+        migrate(client[os.environ['DB_NAME']])
+    finally:
+        client.close()
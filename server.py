@@ -1,10 +1,22 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, BackgroundTasks, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
+import asyncio
 import logging
+import hmac
+import hashlib
+import time
+import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
@@ -12,20 +24,61 @@ import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
+from cachetools import TTLCache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    uuidRepresentation='standard',
+    tz_aware=True,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '10')),
+    serverSelectionTimeoutMS=3000,
+    compressors='zstd,zlib',
+    retryWrites=True
+)
 db = client[os.environ['DB_NAME']]
+# Carts are recoverable, so acknowledge writes from the primary's memory
+carts_collection = db.get_collection('carts', write_concern=WriteConcern(w=1, j=False))
+# Let Mongo stamp cart updates instead of formatting a timestamp per request
+CART_TOUCHED = {'updated_at': {'$type': 'date'}}
+CART_ADD_ATTEMPTS = 3
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
+PAGE_SIZE_MAX = 200
+# CORSMiddleware only tests membership, so a frozenset makes preflight checks O(1)
+CORS_ORIGINS = frozenset(o.strip() for o in os.environ.get('CORS_ORIGINS', '*').split(',') if o.strip())
+
+# bcrypt releases the GIL, so hashing on a thread pool keeps the event loop free
+BCRYPT_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+# Unset BCRYPT_ROUNDS means benchmark at startup and target ~250 ms per hash,
+# never going below the previous fixed default of 12
+_BCRYPT_ROUNDS_ENV = os.environ.get('BCRYPT_ROUNDS')
+BCRYPT_MIN_ROUNDS = 12
+_BCRYPT_ROUNDS = int(_BCRYPT_ROUNDS_ENV or BCRYPT_MIN_ROUNDS)
+BCRYPT_TARGET_SECONDS = 0.25
+
+# token digest -> (exp, user); saves a jwt.decode and a users lookup per request.
+# The cache is per process: an eviction only reaches the worker that served the write,
+# so other workers may serve a stale wishlist, is_admin flag or deleted user for up to
+# the TTL. Keep it short for that reason.
+TOKEN_CACHE_TTL = 60
+token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+# user id -> token digests in token_cache, so evicting a user doesn't scan the cache.
+# Refreshed on every insert with the same TTL, so it outlives the keys it lists.
+user_token_keys = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+# product id -> product document. Per process like token_cache: update, delete and review
+# evictions only clear the worker that served the write, so other workers can serve stale
+# price, stock or rating, or a deleted product, for up to the TTL.
+product_cache = TTLCache(maxsize=1024, ttl=60)
 
 # Pydantic Models
 class UserCreate(BaseModel):
@@ -39,16 +92,16 @@ class UserLogin(BaseModel):
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str
+    id: uuid.UUID
     name: str
     email: str
     is_admin: bool = False
-    wishlist: List[str] = []
+    wishlist: List[uuid.UUID] = []
     created_at: str
 
 class Product(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str
+    id: uuid.UUID
     name: str
     description: str
     price: float
@@ -73,9 +126,9 @@ class ProductCreate(BaseModel):
 
 class Review(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str
-    product_id: str
-    user_id: str
+    id: uuid.UUID
+    product_id: uuid.UUID
+    user_id: uuid.UUID
     user_name: str
     rating: int
     comment: str
@@ -86,19 +139,19 @@ class ReviewCreate(BaseModel):
     comment: str
 
 class CartItem(BaseModel):
-    product_id: str
+    product_id: uuid.UUID
     quantity: int
     size: str
     color: str
 
 class Cart(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    user_id: str
+    user_id: uuid.UUID
     items: List[CartItem]
-    updated_at: str
+    updated_at: datetime
 
 class OrderItem(BaseModel):
-    product_id: str
+    product_id: uuid.UUID
     product_name: str
     quantity: int
     size: str
@@ -107,8 +160,8 @@ class OrderItem(BaseModel):
 
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str
-    user_id: str
+    id: uuid.UUID
+    user_id: uuid.UUID
     user_name: str
     user_email: str
     items: List[OrderItem]
@@ -124,26 +177,118 @@ class OrderCreate(BaseModel):
 
 # Helper Functions
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(_BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_token(user_id: str) -> str:
+def _benchmark_bcrypt_rounds(min_rounds: int = BCRYPT_MIN_ROUNDS, max_rounds: int = 14) -> int:
+    for rounds in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'x', bcrypt.gensalt(rounds))
+        if time.perf_counter() - start >= BCRYPT_TARGET_SECONDS:
+            return rounds
+    return max_rounds
+
+async def _hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BCRYPT_POOL, hash_password, password)
+
+async def _verify(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BCRYPT_POOL, verify_password, password, hashed)
+
+def create_token(user_id: uuid.UUID) -> str:
     payload = {
-        'user_id': user_id,
+        'user_id': str(user_id),
         'exp': datetime.now(timezone.utc) + timedelta(days=7)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+def _cache_user(key: bytes, exp: float, user: dict) -> None:
+    token_cache[key] = (exp, user)
+    keys = {k for k in user_token_keys.get(user['id'], ()) if k in token_cache}
+    keys.add(key)
+    user_token_keys[user['id']] = keys
+
+def _evict_user(user_id: uuid.UUID) -> None:
+    for key in user_token_keys.pop(user_id, ()):
+        token_cache.pop(key, None)
+
+async def _get_product_cached(product_id: uuid.UUID) -> Optional[dict]:
+    product = product_cache.get(product_id)
+    if product is None:
+        product = await db.products.find_one({'id': product_id}, {'_id': 0, 'rating_sum': 0})
+        if product:
+            product_cache[product_id] = product
+    return product
+
+def _decode_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(cursor)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# (created_at, _id) cursors are base64url so '+00:00' survives an unencoded round trip
+def _encode_keyset_cursor(value: str, last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(f"{value}|{last_id}".encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_keyset_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode('utf-8')
+        value, last_id = raw.split('|')
+        datetime.fromisoformat(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, _decode_cursor(last_id)
+
+async def paginate(collection, query: dict, limit: int, cursor: Optional[str], projection: Optional[dict] = None,
+                   sort_field: str = '_id', direction: int = 1) -> dict:
+    op = '$gt' if direction == 1 else '$lt'
+    sort = [(sort_field, direction)]
+    if sort_field != '_id':
+        # Break ties on _id so documents sharing a sort value aren't skipped at page boundaries
+        sort.append(('_id', direction))
+    
+    if cursor and sort_field == '_id':
+        query = {**query, '_id': {op: _decode_cursor(cursor)}}
+    elif cursor:
+        value, last_id = _decode_keyset_cursor(cursor)
+        query = {**query, '$or': [{sort_field: {op: value}}, {sort_field: value, '_id': {op: last_id}}]}
+    
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    return _page(docs, limit, sort_field)
+
+def _page(docs: List[dict], limit: int, sort_field: str = '_id') -> dict:
+    next_cursor = None
+    if len(docs) > limit:
+        last = docs[limit - 1]
+        next_cursor = str(last['_id']) if sort_field == '_id' else _encode_keyset_cursor(last[sort_field], last['_id'])
+    items = docs[:limit]
+    for doc in items:
+        doc.pop('_id', None)
+    return {'items': items, 'next_cursor': next_cursor}
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    token = credentials.credentials
+    key = _token_key(token)
+    cached = token_cache.get(key)
+    if cached and cached[0] > datetime.now(timezone.utc).timestamp():
+        return cached[1]
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get('user_id')
+        try:
+            user_id = uuid.UUID(str(payload.get('user_id')))
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Invalid token")
         user = await db.users.find_one({'id': user_id}, {'_id': 0, 'password': 0})
-        if not user:
+        stored_id = user['id'].bytes if user else b''
+        if not hmac.compare_digest(user_id.bytes, stored_id) or not user:
             raise HTTPException(status_code=401, detail="User not found")
+        _cache_user(key, payload.get('exp', 0), user)
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -155,6 +300,29 @@ async def get_admin_user(user: dict = Depends(get_current_user)) -> dict:
         raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
+def _log_order_email(order: dict) -> None:
+    address = order['shipping_address']
+    lines = [
+        f"\n{'='*50}\nORDER CONFIRMATION EMAIL\n{'='*50}",
+        f"To: {order['user_email']}",
+        f"Subject: Order Confirmation - {order['id']}",
+        f"\nHi {order['user_name']},\n",
+        f"Your order has been placed successfully!\n",
+        f"Order ID: {order['id']}",
+        f"Total Amount: ${order['total_amount']:.2f}\n",
+        "Items:",
+    ]
+    for item in order['items']:
+        lines.append(f"  - {item['product_name']} (Size: {item['size']}, Color: {item['color']}) x{item['quantity']} - ${item['price']:.2f}")
+    lines += [
+        "\nShipping Address:",
+        f"  {address.get('name')}",
+        f"  {address.get('address')}",
+        f"  {address.get('city')}, {address.get('state')} {address.get('zip')}",
+        f"\nThank you for shopping with OVERSIZE_CULT!\n{'='*50}\n",
+    ]
+    logger.info('\n'.join(lines))
+
 # Auth Routes
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
@@ -162,18 +330,21 @@ async def register(user_data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    user_id = str(uuid.uuid4())
+    user_id = uuid.uuid4()
     user_doc = {
         'id': user_id,
         'name': user_data.name,
         'email': user_data.email,
-        'password': hash_password(user_data.password),
+        'password': await _hash(user_data.password),
         'is_admin': False,
         'wishlist': [],
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     token = create_token(user_id)
     
     return {'token': token, 'user': {'id': user_id, 'name': user_data.name, 'email': user_data.email, 'is_admin': False}}
@@ -181,7 +352,7 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({'email': credentials.email})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await _verify(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user['id'])
@@ -193,7 +364,9 @@ async def get_me(user: dict = Depends(get_current_user)):
 
 # Product Routes
 @api_router.get("/products")
-async def get_products(size: Optional[str] = None, color: Optional[str] = None, design: Optional[str] = None):
+async def get_products(size: Optional[str] = None, color: Optional[str] = None, design: Optional[str] = None,
+                       fields: Optional[str] = None, limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX),
+                       cursor: Optional[str] = None):
     query = {}
     if size:
         query['sizes'] = size
@@ -202,237 +375,249 @@ async def get_products(size: Optional[str] = None, color: Optional[str] = None,
     if design:
         query['design_category'] = design
     
-    products = await db.products.find(query, {'_id': 0}).to_list(1000)
-    return products
+    # Listings only need the thumbnail; full documents come from GET /products/{id}
+    projection = {'description': 0, 'rating_sum': 0, 'images': {'$slice': 1}}
+    if fields:
+        requested = {f.strip() for f in fields.split(',') if f.strip()}
+        unknown = requested - Product.model_fields.keys()
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        projection = {f: 1 for f in requested | {'id'}}
+    
+    return await paginate(db.products, query, limit, cursor, projection)
 
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: str):
-    product = await db.products.find_one({'id': product_id}, {'_id': 0})
+async def get_product(product_id: uuid.UUID):
+    product = await _get_product_cached(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 @api_router.post("/products", response_model=Product)
 async def create_product(product_data: ProductCreate, admin: dict = Depends(get_admin_user)):
-    product_id = str(uuid.uuid4())
-    product_doc = {
+    product_id = uuid.uuid4()
+    product_doc = product_data.model_dump()
+    product_doc.update({
         'id': product_id,
-        **product_data.model_dump(),
         'rating': 0.0,
+        'rating_sum': 0.0,
         'review_count': 0,
         'created_at': datetime.now(timezone.utc).isoformat()
-    }
+    })
     
     await db.products.insert_one(product_doc)
     return product_doc
 
 @api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product_data: ProductCreate, admin: dict = Depends(get_admin_user)):
+async def update_product(product_id: uuid.UUID, product_data: ProductCreate, admin: dict = Depends(get_admin_user)):
     result = await db.products.find_one({'id': product_id}, {'_id': 0})
     if not result:
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = product_data.model_dump()
     await db.products.update_one({'id': product_id}, {'$set': update_data})
+    product_cache.pop(product_id, None)
     
     updated = await db.products.find_one({'id': product_id}, {'_id': 0})
     return updated
 
 @api_router.delete("/products/{product_id}")
-async def delete_product(product_id: str, admin: dict = Depends(get_admin_user)):
+async def delete_product(product_id: uuid.UUID, admin: dict = Depends(get_admin_user)):
     result = await db.products.delete_one({'id': product_id})
+    product_cache.pop(product_id, None)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     return {'message': 'Product deleted'}
 
 # Review Routes
 @api_router.get("/products/{product_id}/reviews")
-async def get_reviews(product_id: str):
-    reviews = await db.reviews.find({'product_id': product_id}, {'_id': 0}).to_list(1000)
-    return reviews
+async def get_reviews(product_id: uuid.UUID, limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None):
+    return await paginate(db.reviews, {'product_id': product_id}, limit, cursor)
 
 @api_router.post("/products/{product_id}/reviews")
-async def create_review(product_id: str, review_data: ReviewCreate, user: dict = Depends(get_current_user)):
-    product = await db.products.find_one({'id': product_id})
+async def create_review(product_id: uuid.UUID, review_data: ReviewCreate, user: dict = Depends(get_current_user)):
+    product = await _get_product_cached(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    existing = await db.reviews.find_one({'product_id': product_id, 'user_id': user['id']})
-    if existing:
-        raise HTTPException(status_code=400, detail="You already reviewed this product")
-    
-    review_id = str(uuid.uuid4())
-    review_doc = {
+    review_id = uuid.uuid4()
+    review_doc = review_data.model_dump()
+    review_doc.update({
         'id': review_id,
         'product_id': product_id,
         'user_id': user['id'],
         'user_name': user['name'],
-        **review_data.model_dump(),
         'created_at': datetime.now(timezone.utc).isoformat()
-    }
+    })
     
-    await db.reviews.insert_one(review_doc)
+    try:
+        await db.reviews.insert_one(review_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="You already reviewed this product")
+    review_doc.pop('_id', None)
     
-    reviews = await db.reviews.find({'product_id': product_id}).to_list(1000)
-    avg_rating = sum(r['rating'] for r in reviews) / len(reviews)
-    await db.products.update_one(
+    # Products created before rating_sum existed fall back to rating * review_count
+    result = await db.products.update_one(
         {'id': product_id},
-        {'$set': {'rating': round(avg_rating, 1), 'review_count': len(reviews)}}
+        [
+            {'$set': {
+                'rating_sum': {'$add': [
+                    {'$ifNull': ['$rating_sum', {'$multiply': ['$rating', '$review_count']}]},
+                    review_data.rating
+                ]},
+                'review_count': {'$add': ['$review_count', 1]}
+            }},
+            {'$set': {'rating': {'$round': [{'$divide': ['$rating_sum', '$review_count']}, 1]}}}
+        ]
     )
+    product_cache.pop(product_id, None)
+    if result.matched_count == 0:
+        # The cached existence check is per worker; the product was deleted elsewhere
+        await db.reviews.delete_one({'id': review_id})
+        raise HTTPException(status_code=404, detail="Product not found")
     
     return review_doc
 
 # Cart Routes
 @api_router.get("/cart")
 async def get_cart(user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({'user_id': user['id']}, {'_id': 0})
+    cart = await carts_collection.find_one({'user_id': user['id']}, {'_id': 0})
     if not cart:
         return {'user_id': user['id'], 'items': [], 'updated_at': datetime.now(timezone.utc).isoformat()}
     return cart
 
 @api_router.post("/cart")
 async def add_to_cart(item: CartItem, user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({'user_id': user['id']})
+    match = {'product_id': item.product_id, 'size': item.size, 'color': item.color}
+    increment = (
+        {'user_id': user['id'], 'items': {'$elemMatch': match}},
+        {'$inc': {'items.$.quantity': item.quantity}, '$currentDate': CART_TOUCHED}
+    )
+    push = (
+        {'user_id': user['id'], 'items': {'$not': {'$elemMatch': match}}},
+        {'$push': {'items': item.model_dump()}, '$currentDate': CART_TOUCHED}
+    )
     
-    if not cart:
-        cart_doc = {
-            'user_id': user['id'],
-            'items': [item.model_dump()],
-            'updated_at': datetime.now(timezone.utc).isoformat()
-        }
-        await db.carts.insert_one(cart_doc)
+    # Increment an existing line, else push it while it is still absent. A DuplicateKeyError
+    # means a concurrent add created the cart first, so start over against the winner's cart.
+    for _ in range(CART_ADD_ATTEMPTS):
+        result = await carts_collection.update_one(*increment)
+        if result.matched_count:
+            break
+        try:
+            result = await carts_collection.update_one(*push, upsert=True)
+        except DuplicateKeyError:
+            continue
+        if result.matched_count or result.upserted_id is not None:
+            break
     else:
-        items = cart.get('items', [])
-        found = False
-        for i, existing_item in enumerate(items):
-            if (existing_item['product_id'] == item.product_id and 
-                existing_item['size'] == item.size and 
-                existing_item['color'] == item.color):
-                items[i]['quantity'] += item.quantity
-                found = True
-                break
-        
-        if not found:
-            items.append(item.model_dump())
-        
-        await db.carts.update_one(
-            {'user_id': user['id']},
-            {'$set': {'items': items, 'updated_at': datetime.now(timezone.utc).isoformat()}}
-        )
+        raise HTTPException(status_code=409, detail="Cart was modified concurrently, please retry")
     
     return {'message': 'Item added to cart'}
 
 @api_router.put("/cart/{product_id}")
-async def update_cart_item(product_id: str, quantity: int, size: str, color: str, user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({'user_id': user['id']})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    items = cart.get('items', [])
-    for item in items:
-        if item['product_id'] == product_id and item['size'] == size and item['color'] == color:
-            item['quantity'] = quantity
-            break
-    
-    await db.carts.update_one(
+async def update_cart_item(product_id: uuid.UUID, quantity: int, size: str, color: str, user: dict = Depends(get_current_user)):
+    result = await carts_collection.update_one(
         {'user_id': user['id']},
-        {'$set': {'items': items, 'updated_at': datetime.now(timezone.utc).isoformat()}}
+        {'$set': {'items.$[e].quantity': quantity}, '$currentDate': CART_TOUCHED},
+        array_filters=[{'e.product_id': product_id, 'e.size': size, 'e.color': color}]
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cart not found")
     
     return {'message': 'Cart updated'}
 
 @api_router.delete("/cart/{product_id}")
-async def remove_from_cart(product_id: str, size: str, color: str, user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({'user_id': user['id']})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    items = [item for item in cart.get('items', []) 
-             if not (item['product_id'] == product_id and item['size'] == size and item['color'] == color)]
-    
-    await db.carts.update_one(
+async def remove_from_cart(product_id: uuid.UUID, size: str, color: str, user: dict = Depends(get_current_user)):
+    result = await carts_collection.update_one(
         {'user_id': user['id']},
-        {'$set': {'items': items, 'updated_at': datetime.now(timezone.utc).isoformat()}}
+        {
+            '$pull': {'items': {'product_id': product_id, 'size': size, 'color': color}},
+            '$currentDate': CART_TOUCHED
+        }
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cart not found")
     
     return {'message': 'Item removed from cart'}
 
 # Wishlist Routes
 @api_router.post("/wishlist/{product_id}")
-async def add_to_wishlist(product_id: str, user: dict = Depends(get_current_user)):
-    wishlist = user.get('wishlist', [])
-    if product_id not in wishlist:
-        wishlist.append(product_id)
-        await db.users.update_one({'id': user['id']}, {'$set': {'wishlist': wishlist}})
+async def add_to_wishlist(product_id: uuid.UUID, user: dict = Depends(get_current_user)):
+    await db.users.update_one({'id': user['id']}, {'$addToSet': {'wishlist': product_id}})
+    _evict_user(user['id'])
     return {'message': 'Added to wishlist'}
 
 @api_router.delete("/wishlist/{product_id}")
-async def remove_from_wishlist(product_id: str, user: dict = Depends(get_current_user)):
-    wishlist = user.get('wishlist', [])
-    if product_id in wishlist:
-        wishlist.remove(product_id)
-        await db.users.update_one({'id': user['id']}, {'$set': {'wishlist': wishlist}})
+async def remove_from_wishlist(product_id: uuid.UUID, user: dict = Depends(get_current_user)):
+    await db.users.update_one({'id': user['id']}, {'$pull': {'wishlist': product_id}})
+    _evict_user(user['id'])
     return {'message': 'Removed from wishlist'}
 
 @api_router.get("/wishlist")
-async def get_wishlist(user: dict = Depends(get_current_user)):
-    wishlist_ids = user.get('wishlist', [])
-    if not wishlist_ids:
-        return []
-    products = await db.products.find({'id': {'$in': wishlist_ids}}, {'_id': 0}).to_list(1000)
-    return products
+async def get_wishlist(limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                       user: dict = Depends(get_current_user)):
+    product_match = {'_id': {'$gt': _decode_cursor(cursor)}} if cursor else {}
+    
+    # Join server-side so the wishlist is read fresh rather than from the cached user.
+    # localField/foreignField with a pipeline (MongoDB 5.0+) keeps the products.id index in play.
+    result = await db.users.aggregate([
+        {'$match': {'id': user['id']}},
+        {'$lookup': {
+            'from': 'products',
+            'localField': 'wishlist',
+            'foreignField': 'id',
+            'pipeline': [
+                {'$match': product_match}, {'$sort': {'_id': 1}}, {'$limit': limit + 1},
+                {'$project': {'rating_sum': 0}}
+            ],
+            'as': 'products'
+        }},
+        {'$project': {'_id': 0, 'products': 1}}
+    ]).to_list(1)
+    
+    products = result[0]['products'] if result else []
+    return _page(products, limit)
 
 # Order Routes
 @api_router.post("/orders")
-async def create_order(order_data: OrderCreate, user: dict = Depends(get_current_user)):
-    order_id = str(uuid.uuid4())
-    order_doc = {
+async def create_order(order_data: OrderCreate, background: BackgroundTasks, user: dict = Depends(get_current_user)):
+    order_id = uuid.uuid4()
+    order_doc = order_data.model_dump()
+    order_doc.update({
         'id': order_id,
         'user_id': user['id'],
         'user_name': user['name'],
         'user_email': user['email'],
-        **order_data.model_dump(),
         'status': 'pending',
         'created_at': datetime.now(timezone.utc).isoformat()
-    }
+    })
     
     await db.orders.insert_one(order_doc)
-    await db.carts.delete_one({'user_id': user['id']})
+    order_doc.pop('_id', None)
+    await carts_collection.delete_one({'user_id': user['id']})
     
-    print(f"\n{'='*50}\nORDER CONFIRMATION EMAIL\n{'='*50}")
-    print(f"To: {user['email']}")
-    print(f"Subject: Order Confirmation - {order_id}")
-    print(f"\nHi {user['name']},\n")
-    print(f"Your order has been placed successfully!\n")
-    print(f"Order ID: {order_id}")
-    print(f"Total Amount: ${order_data.total_amount:.2f}\n")
-    print(f"Items:")
-    for item in order_data.items:
-        print(f"  - {item.product_name} (Size: {item.size}, Color: {item.color}) x{item.quantity} - ${item.price:.2f}")
-    print(f"\nShipping Address:")
-    print(f"  {order_data.shipping_address.get('name')}")
-    print(f"  {order_data.shipping_address.get('address')}")
-    print(f"  {order_data.shipping_address.get('city')}, {order_data.shipping_address.get('state')} {order_data.shipping_address.get('zip')}")
-    print(f"\nThank you for shopping with OVERSIZE_CULT!\n{'='*50}\n")
+    background.add_task(_log_order_email, order_doc)
     
     return order_doc
 
 @api_router.get("/orders")
-async def get_user_orders(user: dict = Depends(get_current_user)):
-    orders = await db.orders.find({'user_id': user['id']}, {'_id': 0}).sort('created_at', -1).to_list(1000)
-    return orders
+async def get_user_orders(limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                          user: dict = Depends(get_current_user)):
+    return await paginate(db.orders, {'user_id': user['id']}, limit, cursor,
+                          sort_field='created_at', direction=-1)
 
 @api_router.get("/admin/orders")
-async def get_all_orders(admin: dict = Depends(get_admin_user)):
-    orders = await db.orders.find({}, {'_id': 0}).sort('created_at', -1).to_list(1000)
-    return orders
+async def get_all_orders(limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                         admin: dict = Depends(get_admin_user)):
+    return await paginate(db.orders, {}, limit, cursor, sort_field='created_at', direction=-1)
 
 app.include_router(api_router)
 
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -443,6 +628,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await db.users.create_index('email', unique=True)
+    await db.users.create_index('id', unique=True)
+    await db.products.create_index('id', unique=True)
+    await db.products.create_index('sizes')
+    await db.products.create_index('colors')
+    await db.products.create_index('design_category')
+    await db.reviews.create_index([('product_id', 1), ('user_id', 1)], unique=True)
+    await db.reviews.create_index([('product_id', 1), ('_id', 1)])
+    await carts_collection.create_index('user_id', unique=True)
+    await db.orders.create_index([('user_id', 1), ('created_at', -1), ('_id', -1)])
+    await db.orders.create_index([('created_at', -1), ('_id', -1)])
+
+@app.on_event("startup")
+async def check_uuid_migration():
+    if await db.users.find_one({'id': {'$type': 'string'}}, {'_id': 1}):
+        logger.error("Found string user ids; run migrate_uuids.py before serving traffic")
+
+@app.on_event("startup")
+async def select_bcrypt_rounds():
+    global _BCRYPT_ROUNDS
+    if not _BCRYPT_ROUNDS_ENV:
+        # Workers benchmarking side by side see inflated timings; the launcher below avoids
+        # this by benchmarking once and exporting BCRYPT_ROUNDS
+        loop = asyncio.get_running_loop()
+        _BCRYPT_ROUNDS = await loop.run_in_executor(BCRYPT_POOL, _benchmark_bcrypt_rounds)
+    elif _BCRYPT_ROUNDS < BCRYPT_MIN_ROUNDS:
+        logger.warning(f"BCRYPT_ROUNDS={_BCRYPT_ROUNDS} is below the default cost of {BCRYPT_MIN_ROUNDS}")
+    logger.info(f"Hashing passwords with bcrypt cost {_BCRYPT_ROUNDS}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    BCRYPT_POOL.shutdown(wait=False)
+
+if __name__ == "__main__":
+    # Production runs under gunicorn -k uvicorn.workers.UvicornWorker -w $((2*$(nproc)+1))
+    import uvicorn
+    # Benchmark once here so every worker inherits the same cost
+    if not _BCRYPT_ROUNDS_ENV:
+        os.environ['BCRYPT_ROUNDS'] = str(_benchmark_bcrypt_rounds())
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8000')),
+        workers=int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1)),
+        loop="auto",
+        http="auto"
+    )
@@ -0,0 +1,66 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import mongomock
+import pytest
+from bson.binary import Binary, UuidRepresentation
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def encode_uuids(value):
+    """Encode UUIDs as Motor does with uuidRepresentation='standard'; mongomock's updates don't."""
+    if isinstance(value, uuid.UUID):
+        return Binary.from_uuid(value, UuidRepresentation.STANDARD)
+    if isinstance(value, dict):
+        return {k: encode_uuids(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(encode_uuids(v) for v in value)
+    return value
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    async def to_list(self, length):
+        return list(self._cursor)[:length]
+
+
+class AsyncCollection:
+    """Just enough of Motor's collection API on top of mongomock."""
+
+    def __init__(self, collection):
+        self.sync = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.sync.find(*encode_uuids(args), **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self.sync.find_one(*encode_uuids(args), **kwargs)
+
+    async def insert_one(self, document, **kwargs):
+        return self.sync.insert_one(encode_uuids(document), **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return self.sync.update_one(*encode_uuids(args), **encode_uuids(kwargs))
+
+    async def delete_one(self, *args, **kwargs):
+        return self.sync.delete_one(*encode_uuids(args), **kwargs)
+
+
+@pytest.fixture
+def mock_db():
+    return mongomock.MongoClient(tz_aware=True).test
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from conftest import AsyncCollection
+
+
+class RacingUsers(AsyncCollection):
+    """Misses a sign-up for the same email that lands between the lookup and the insert."""
+
+    async def find_one(self, *args, **kwargs):
+        return None
+
+
+def test_register_rejects_email_taken_by_a_concurrent_signup(mock_db, monkeypatch):
+    mock_db.users.create_index('email', unique=True)
+    mock_db.users.insert_one({'email': 'ada@example.com'})
+    monkeypatch.setattr(server, 'db', SimpleNamespace(users=RacingUsers(mock_db.users)))
+    monkeypatch.setattr(server, '_BCRYPT_ROUNDS', 4)
+    user = server.UserCreate(name='Ada', email='ada@example.com', password='secret')
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.register(user))
+
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Email already registered"
+    assert mock_db.users.count_documents({}) == 1
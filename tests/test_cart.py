@@ -0,0 +1,75 @@
+import asyncio
+import uuid
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+from conftest import AsyncCollection, encode_uuids
+
+
+class RacingCarts(AsyncCollection):
+    """Loses the first upsert to a concurrent add that inserted the user's cart in between."""
+
+    def __init__(self, collection, winner_item):
+        super().__init__(collection)
+        self.winner_item = winner_item
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        if upsert and self.winner_item:
+            self.sync.insert_one(encode_uuids({'user_id': filter['user_id'], 'items': [self.winner_item]}))
+            self.winner_item = None
+            raise DuplicateKeyError("E11000 duplicate key error collection: test.carts index: user_id_1")
+        return await super().update_one(filter, update, upsert=upsert, **kwargs)
+
+
+@pytest.fixture
+def carts(mock_db, monkeypatch):
+    mock_db.carts.create_index('user_id', unique=True)
+    collection = AsyncCollection(mock_db.carts)
+    monkeypatch.setattr(server, 'carts_collection', collection)
+    return collection
+
+
+def _item(product_id, quantity=1, size='M', color='black'):
+    return server.CartItem(product_id=product_id, quantity=quantity, size=size, color=color)
+
+
+def test_add_to_cart_merges_matching_lines(carts):
+    user = {'id': uuid.uuid4()}
+    product_id = uuid.uuid4()
+
+    asyncio.run(server.add_to_cart(_item(product_id, 1), user))
+    asyncio.run(server.add_to_cart(_item(product_id, 2), user))
+    asyncio.run(server.add_to_cart(_item(product_id, 1, size='L'), user))
+
+    cart = carts.sync.find_one(encode_uuids({'user_id': user['id']}))
+    assert [(i['size'], i['quantity']) for i in cart['items']] == [('M', 3), ('L', 1)]
+
+
+def test_add_to_cart_survives_losing_the_cart_creation_race(mock_db, monkeypatch):
+    mock_db.carts.create_index('user_id', unique=True)
+    user = {'id': uuid.uuid4()}
+    winner = _item(uuid.uuid4()).model_dump()
+    collection = RacingCarts(mock_db.carts, winner)
+    monkeypatch.setattr(server, 'carts_collection', collection)
+
+    loser = _item(uuid.uuid4(), 2)
+    asyncio.run(server.add_to_cart(loser, user))
+
+    cart = mock_db.carts.find_one(encode_uuids({'user_id': user['id']}))
+    assert [i['product_id'] for i in cart['items']] == encode_uuids([winner['product_id'], loser.product_id])
+    assert mock_db.carts.count_documents({}) == 1
+
+
+def test_add_to_cart_increments_when_racer_added_same_line(mock_db, monkeypatch):
+    mock_db.carts.create_index('user_id', unique=True)
+    user = {'id': uuid.uuid4()}
+    item = _item(uuid.uuid4(), 2)
+    collection = RacingCarts(mock_db.carts, {**item.model_dump(), 'quantity': 1})
+    monkeypatch.setattr(server, 'carts_collection', collection)
+
+    asyncio.run(server.add_to_cart(item, user))
+
+    cart = mock_db.carts.find_one(encode_uuids({'user_id': user['id']}))
+    assert [i['quantity'] for i in cart['items']] == [3]
@@ -0,0 +1,73 @@
+import base64
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from conftest import AsyncCollection
+
+
+@pytest.fixture
+def client(mock_db, monkeypatch):
+    monkeypatch.setattr(server, 'db', SimpleNamespace(orders=AsyncCollection(mock_db.orders)))
+    server.app.dependency_overrides[server.get_admin_user] = lambda: {'is_admin': True}
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def _insert_orders(mock_db, count, created_at):
+    mock_db.orders.insert_many([{'id': i, 'created_at': created_at} for i in range(count)])
+
+
+def _walk(client, limit, encode=True):
+    seen, cursor = [], None
+    while True:
+        if cursor is None:
+            response = client.get('/api/admin/orders', params={'limit': limit})
+        elif encode:
+            response = client.get('/api/admin/orders', params={'limit': limit, 'cursor': cursor})
+        else:
+            response = client.get(f'/api/admin/orders?limit={limit}&cursor={cursor}')
+        assert response.status_code == 200
+        body = response.json()
+        seen += [order['id'] for order in body['items']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize('encode', [True, False])
+def test_orders_sharing_a_timestamp_are_not_skipped(client, mock_db, encode):
+    _insert_orders(mock_db, 4, datetime(2026, 1, 1, tzinfo=timezone.utc).isoformat())
+
+    assert _walk(client, limit=1, encode=encode) == [3, 2, 1, 0]
+
+
+def test_orders_paginate_newest_first_across_timestamps(client, mock_db):
+    mock_db.orders.insert_many([
+        {'id': i, 'created_at': datetime(2026, 1, 1 + i // 2, tzinfo=timezone.utc).isoformat()}
+        for i in range(5)
+    ])
+
+    assert _walk(client, limit=2) == [4, 3, 2, 1, 0]
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor!',
+    '0' * 24,
+    _b64('2026-01-01T00:00:00+00:00'),
+    _b64('2026-01-01T00:00:00+00:00|nope'),
+    _b64('yesterday|' + '0' * 24),
+    _b64('|' + '0' * 24),
+])
+def test_malformed_order_cursor_is_rejected(client, cursor):
+    response = client.get('/api/admin/orders', params={'cursor': cursor})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Invalid cursor"
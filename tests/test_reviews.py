@@ -0,0 +1,27 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from conftest import AsyncCollection
+
+
+def test_create_review_for_product_deleted_on_another_worker_is_404(mock_db, monkeypatch):
+    product_id = uuid.uuid4()
+    # Another worker deleted the product; this worker still has it cached
+    monkeypatch.setitem(server.product_cache, product_id, {'id': product_id})
+    monkeypatch.setattr(server, 'db', SimpleNamespace(
+        products=AsyncCollection(mock_db.products),
+        reviews=AsyncCollection(mock_db.reviews),
+    ))
+    user = {'id': uuid.uuid4(), 'name': 'Ada'}
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.create_review(product_id, server.ReviewCreate(rating=5, comment='Great'), user))
+
+    assert exc.value.status_code == 404
+    assert mock_db.reviews.count_documents({}) == 0
+    assert product_id not in server.product_cache